@@ -1,7 +1,7 @@
 from micropython import const
 
 from trezor import wire
-from trezor.crypto import bech32, bip32, der
+from trezor.crypto import bech32, bip32
 from trezor.crypto.curve import secp256k1
 from trezor.utils import ensure
 
@@ -12,9 +12,9 @@ _BECH32_WITVER = const(0x00)
 
 
 def ecdsa_sign(node: bip32.HDNode, digest: bytes) -> bytes:
-    sig = secp256k1.sign(node.private_key(), digest)
-    sigder = der.encode_seq((sig[1:33], sig[33:65]))
-    return sigder
+    # the DER encoding is done at C level, avoiding the temporary copies
+    # of r and s that slicing the compact signature would make
+    return secp256k1.sign_der(node.private_key(), digest)
 
 
 def ecdsa_hash_pubkey(pubkey: bytes, coin: CoinInfo) -> bytes:
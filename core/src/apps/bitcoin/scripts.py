@@ -1,7 +1,15 @@
+from micropython import const
+
 from trezor import utils, wire
 from trezor.crypto import base58, cashaddr
 from trezor.crypto.hashlib import sha256
-from trezor.messages import InputScriptType, OutputScriptType
+from trezor.messages import OutputScriptType
+from trezor.messages.InputScriptType import (
+    SPENDADDRESS,
+    SPENDMULTISIG,
+    SPENDP2SHWITNESS,
+    SPENDWITNESS,
+)
 from trezor.messages.MultisigRedeemScriptType import MultisigRedeemScriptType
 from trezor.messages.TxInputType import TxInputType
 from trezor.messages.TxOutputType import TxOutputType
@@ -16,12 +24,50 @@ from .multisig import (
     multisig_get_pubkeys,
     multisig_pubkey_index,
 )
-from .writers import write_bytes_fixed, write_bytes_unchecked, write_op_push
+from .writers import write_bytes_unchecked, write_op_push
 
 if False:
-    from typing import List, Optional
+    from typing import Dict, List, Optional, Tuple
     from .writers import Writer
 
+# Serialized multisig redeem scripts are needed several times per input
+# (script code derivation, scriptSig and witness serialization), and the
+# pubkey derivation behind them is expensive.  Cache the derived pubkeys,
+# the serialized script and its SHA-256 digest per message object.  The
+# message itself is kept referenced by the entry so that its id() cannot
+# be recycled while the entry is alive.  The cache is cleared at the
+# start of each signing session and whenever it grows too big.
+_MULTISIG_CACHE_SIZE = const(4)
+_multisig_cache = {}  # type: Dict[int, Tuple[MultisigRedeemScriptType, List[bytes], bytes, bytes]]
+
+
+# Decoding an output address runs base58 + double-SHA256 checksum or
+# bech32 decoding.  The same address can be asked for several times
+# during one signing session (serialization and change verification
+# passes), so keep a small bounded cache of derived output scripts.
+_OUTPUT_SCRIPT_CACHE_SIZE = const(16)
+_output_script_cache = {}  # type: Dict[str, bytes]
+
+
+def clear_caches() -> None:
+    _multisig_cache.clear()
+    _output_script_cache.clear()
+
+
+def _multisig_get_cached(
+    multisig: MultisigRedeemScriptType,
+) -> Tuple[List[bytes], bytes, bytes]:
+    cached = _multisig_cache.get(id(multisig))
+    if cached is None:
+        if len(_multisig_cache) >= _MULTISIG_CACHE_SIZE:
+            _multisig_cache.clear()
+        pubkeys = multisig_get_pubkeys(multisig)
+        redeem_script = bytes(output_script_multisig(pubkeys, multisig.m))
+        script_hash = sha256(redeem_script).digest()
+        cached = (multisig, pubkeys, redeem_script, script_hash)
+        _multisig_cache[id(multisig)] = cached
+    return cached[1], cached[2], cached[3]
+
 
 def input_derive_script(
     txi: TxInputType,
@@ -30,27 +76,24 @@ def input_derive_script(
     pubkey: bytes,
     signature: Optional[bytes],
 ) -> bytes:
-    if txi.script_type == InputScriptType.SPENDADDRESS:
+    if txi.script_type == SPENDADDRESS:
         # p2pkh or p2sh
         return input_script_p2pkh_or_p2sh(pubkey, signature, hash_type)
 
-    if txi.script_type == InputScriptType.SPENDP2SHWITNESS:
+    if txi.script_type == SPENDP2SHWITNESS:
         # p2wpkh or p2wsh using p2sh
 
         if txi.multisig:
             # p2wsh in p2sh
-            pubkeys = multisig_get_pubkeys(txi.multisig)
-            witness_script_hasher = utils.HashWriter(sha256())
-            write_output_script_multisig(witness_script_hasher, pubkeys, txi.multisig.m)
-            witness_script_hash = witness_script_hasher.get_digest()
+            _, _, witness_script_hash = _multisig_get_cached(txi.multisig)
             return input_script_p2wsh_in_p2sh(witness_script_hash)
 
         # p2wpkh in p2sh
         return input_script_p2wpkh_in_p2sh(common.ecdsa_hash_pubkey(pubkey, coin))
-    elif txi.script_type == InputScriptType.SPENDWITNESS:
+    elif txi.script_type == SPENDWITNESS:
         # native p2wpkh or p2wsh
         return input_script_native_p2wpkh_or_p2wsh()
-    elif txi.script_type == InputScriptType.SPENDMULTISIG:
+    elif txi.script_type == SPENDMULTISIG:
         # p2sh multisig
         signature_index = multisig_pubkey_index(txi.multisig, pubkey)
         return input_script_multisig(
@@ -64,17 +107,33 @@ def output_derive_script(txo: TxOutputType, coin: CoinInfo) -> bytes:
     if txo.script_type == OutputScriptType.PAYTOOPRETURN:
         return output_script_paytoopreturn(txo.op_return_data)
 
-    if coin.bech32_prefix and txo.address.startswith(coin.bech32_prefix):
+    script = _output_script_cache.get(txo.address)
+    if script is None:
+        script = _output_derive_script(txo.address, coin)
+        if len(_output_script_cache) >= _OUTPUT_SCRIPT_CACHE_SIZE:
+            _output_script_cache.clear()
+        _output_script_cache[txo.address] = script
+    return script
+
+
+def _output_derive_script(address: str, coin: CoinInfo) -> bytes:
+    if coin.bech32_prefix and address.startswith(coin.bech32_prefix):
         # p2wpkh or p2wsh
-        witprog = common.decode_bech32_address(coin.bech32_prefix, txo.address)
+        witprog = common.decode_bech32_address(coin.bech32_prefix, address)
         return output_script_native_p2wpkh_or_p2wsh(witprog)
 
-    if (
-        not utils.BITCOIN_ONLY
-        and coin.cashaddr_prefix is not None
-        and txo.address.startswith(coin.cashaddr_prefix + ":")
+    if utils.BITCOIN_ONLY:
+        # utils.BITCOIN_ONLY is replaced with a literal True when
+        # freezing Bitcoin-only firmware, so the compiler drops the
+        # cashaddr branch below from it entirely
+        try:
+            raw_address = base58.decode_check(address, coin.b58_hash)
+        except ValueError:
+            raise wire.DataError("Invalid address")
+    elif coin.cashaddr_prefix is not None and address.startswith(
+        coin.cashaddr_prefix + ":"
     ):
-        prefix, addr = txo.address.split(":")
+        prefix, addr = address.split(":")
         version, data = cashaddr.decode(prefix, addr)
         if version == cashaddr.ADDRESS_TYPE_P2KH:
             version = coin.address_type
@@ -82,48 +141,51 @@ def output_derive_script(txo: TxOutputType, coin: CoinInfo) -> bytes:
             version = coin.address_type_p2sh
         else:
             raise wire.DataError("Unknown cashaddr address type")
-        raw_address = bytes([version]) + data
+        # prepend the version in a single preallocated buffer instead of
+        # building a one-element list, converting and concatenating
+        buf = bytearray(1 + len(data))
+        buf[0] = version
+        buf[1:] = data
+        # address_type.check needs bytes, bytearray has no startswith
+        # under MicroPython
+        raw_address = bytes(buf)
     else:
         try:
-            raw_address = base58.decode_check(txo.address, coin.b58_hash)
+            raw_address = base58.decode_check(address, coin.b58_hash)
         except ValueError:
             raise wire.DataError("Invalid address")
 
     if address_type.check(coin.address_type, raw_address):
         # p2pkh
         pubkeyhash = address_type.strip(coin.address_type, raw_address)
-        script = output_script_p2pkh(pubkeyhash)
-        return script
+        return bytes(output_script_p2pkh(pubkeyhash))
     elif address_type.check(coin.address_type_p2sh, raw_address):
         # p2sh
         scripthash = address_type.strip(coin.address_type_p2sh, raw_address)
-        script = output_script_p2sh(scripthash)
-        return script
+        return bytes(output_script_p2sh(scripthash))
 
     raise wire.DataError("Invalid address type")
 
 
+# script types whose BIP-143 script code is a classic p2pkh
+# (frozenset is not enabled in our MicroPython build)
+_BIP143_P2PKH_SCRIPT_TYPES = {SPENDWITNESS, SPENDP2SHWITNESS, SPENDADDRESS}
+
+
 # see https://github.com/bitcoin/bips/blob/master/bip-0143.mediawiki#specification
 # item 5 for details
-def bip143_derive_script_code(txi: TxInputType, pubkeyhash: bytes) -> bytearray:
+def bip143_derive_script_code(txi: TxInputType, pubkeyhash: bytes) -> bytes:
 
     if txi.multisig:
-        return output_script_multisig(
-            multisig_get_pubkeys(txi.multisig), txi.multisig.m
-        )
+        _, redeem_script, _ = _multisig_get_cached(txi.multisig)
+        return redeem_script
 
-    p2pkh = (
-        txi.script_type == InputScriptType.SPENDWITNESS
-        or txi.script_type == InputScriptType.SPENDP2SHWITNESS
-        or txi.script_type == InputScriptType.SPENDADDRESS
-    )
-    if p2pkh:
+    if txi.script_type in _BIP143_P2PKH_SCRIPT_TYPES:
         # for p2wpkh in p2sh or native p2wpkh
         # the scriptCode is a classic p2pkh
         return output_script_p2pkh(pubkeyhash)
 
-    else:
-        raise wire.DataError("Unknown input script type for bip143 script code")
+    raise wire.DataError("Unknown input script type for bip143 script code")
 
 
 # P2PKH, P2SH
@@ -140,26 +202,25 @@ def input_script_p2pkh_or_p2sh(
     return w
 
 
+# OP_DUP, OP_HASH_160, pushing 20 bytes, <pubkeyhash>, OP_EQUALVERIFY, OP_CHECKSIG
+_OUTPUT_SCRIPT_P2PKH = b"\x76\xa9\x14" + b"\x00" * 20 + b"\x88\xac"
+
+# OP_HASH_160, pushing 20 bytes, <scripthash>, OP_EQUAL
+_OUTPUT_SCRIPT_P2SH = b"\xa9\x14" + b"\x00" * 20 + b"\x87"
+
+
 def output_script_p2pkh(pubkeyhash: bytes) -> bytearray:
     utils.ensure(len(pubkeyhash) == 20)
-    s = bytearray(25)
-    s[0] = 0x76  # OP_DUP
-    s[1] = 0xA9  # OP_HASH_160
-    s[2] = 0x14  # pushing 20 bytes
+    s = bytearray(_OUTPUT_SCRIPT_P2PKH)
     s[3:23] = pubkeyhash
-    s[23] = 0x88  # OP_EQUALVERIFY
-    s[24] = 0xAC  # OP_CHECKSIG
     return s
 
 
 def output_script_p2sh(scripthash: bytes) -> bytearray:
     # A9 14 <scripthash> 87
     utils.ensure(len(scripthash) == 20)
-    s = bytearray(23)
-    s[0] = 0xA9  # OP_HASH_160
-    s[1] = 0x14  # pushing 20 bytes
+    s = bytearray(_OUTPUT_SCRIPT_P2SH)
     s[2:22] = scripthash
-    s[22] = 0x87  # OP_EQUAL
     return s
 
 
@@ -180,18 +241,20 @@ def input_script_native_p2wpkh_or_p2wsh() -> bytearray:
     return bytearray(0)
 
 
-def output_script_native_p2wpkh_or_p2wsh(witprog: bytes) -> bytearray:
+# witness version byte and witness program length, which is
+# 20 (P2WPKH) or 32 (P2WSH) bytes
+_OUTPUT_SCRIPT_NATIVE_SEGWIT_PREFIX = {20: b"\x00\x14", 32: b"\x00\x20"}
+
+
+def output_script_native_p2wpkh_or_p2wsh(witprog: bytes) -> bytes:
     # Either:
     # 00 14 <20-byte-key-hash>
     # 00 20 <32-byte-script-hash>
     length = len(witprog)
     utils.ensure(length == 20 or length == 32)
 
-    w = empty_bytearray(3 + length)
-    w.append(0x00)  # witness version byte
-    w.append(length)  # pub key hash length is 20 (P2WPKH) or 32 (P2WSH) bytes
-    write_bytes_fixed(w, witprog, length)  # pub key hash
-    return w
+    # concatenating two bytes objects allocates the result in one C call
+    return _OUTPUT_SCRIPT_NATIVE_SEGWIT_PREFIX[length] + witprog
 
 
 # SegWit: P2WPKH nested in P2SH
@@ -202,17 +265,18 @@ def output_script_native_p2wpkh_or_p2wsh(witprog: bytes) -> bytearray:
 # Uses normal P2SH output scripts.
 
 
+# data length, witness version byte, pub key hash length, <pubkeyhash>
+_INPUT_SCRIPT_P2WPKH_IN_P2SH = b"\x16\x00\x14" + b"\x00" * 20
+
+
 def input_script_p2wpkh_in_p2sh(pubkeyhash: bytes) -> bytearray:
     # 16 00 14 <pubkeyhash>
     # Signature is moved to the witness.
     utils.ensure(len(pubkeyhash) == 20)
 
-    w = empty_bytearray(3 + len(pubkeyhash))
-    w.append(0x16)  # length of the data
-    w.append(0x00)  # witness version byte
-    w.append(0x14)  # P2WPKH witness program (pub key hash length)
-    write_bytes_fixed(w, pubkeyhash, 20)  # pub key hash
-    return w
+    s = bytearray(_INPUT_SCRIPT_P2WPKH_IN_P2SH)
+    s[3:23] = pubkeyhash  # pub key hash
+    return s
 
 
 # SegWit: P2WSH nested in P2SH
@@ -223,6 +287,10 @@ def input_script_p2wpkh_in_p2sh(pubkeyhash: bytes) -> bytearray:
 # Uses normal P2SH output scripts.
 
 
+# data length, witness version byte, redeem script hash length, <script_hash>
+_INPUT_SCRIPT_P2WSH_IN_P2SH = b"\x22\x00\x20" + b"\x00" * 32
+
+
 def input_script_p2wsh_in_p2sh(script_hash: bytes) -> bytearray:
     # 22 00 20 <redeem script hash>
     # Signature is moved to the witness.
@@ -230,12 +298,9 @@ def input_script_p2wsh_in_p2sh(script_hash: bytes) -> bytearray:
     if len(script_hash) != 32:
         raise wire.DataError("Redeem script hash should be 32 bytes long")
 
-    w = empty_bytearray(3 + len(script_hash))
-    w.append(0x22)  # length of the data
-    w.append(0x00)  # witness version byte
-    w.append(0x20)  # P2WSH witness program (redeem script hash length)
-    write_bytes_fixed(w, script_hash, 32)
-    return w
+    s = bytearray(_INPUT_SCRIPT_P2WSH_IN_P2SH)
+    s[3:35] = script_hash
+    return s
 
 
 # SegWit: Witness getters
@@ -256,31 +321,33 @@ def witness_p2wsh(
     signature_index: int,
     sighash: int,
 ) -> bytearray:
-    # get other signatures, stretch with None to the number of the pubkeys
-    signatures = multisig.signatures + [None] * (
-        multisig_get_pubkey_count(multisig) - len(multisig.signatures)
-    )
-    # fill in our signature
+    # stretch the signature list with empty bytes to the number of the
+    # pubkeys and fill in our signature, all in place
+    signatures = multisig.signatures  # other signatures
+    n_pubkeys = multisig_get_pubkey_count(multisig)
+    while len(signatures) < n_pubkeys:
+        signatures.append(b"")
     if signatures[signature_index]:
         raise wire.DataError("Invalid multisig parameters")
     signatures[signature_index] = signature
 
-    # filter empty
-    signatures = [s for s in signatures if s]
+    # the serialized redeem script
+    _, redeem_script, _ = _multisig_get_cached(multisig)
+    redeem_script_length = len(redeem_script)
 
-    # witness program + signatures + redeem script
-    num_of_witness_items = 1 + len(signatures) + 1
-
-    # length of the redeem script
-    pubkeys = multisig_get_pubkeys(multisig)
-    redeem_script_length = output_script_multisig_length(pubkeys, multisig.m)
-
-    # length of the result
+    # count the signatures and the length of the result in one pass,
+    # empty entries are skipped during serialization below
+    num_of_signatures = 0
     total_length = 1 + 1  # number of items, OP_FALSE
     for s in signatures:
-        total_length += 1 + len(s) + 1  # length, signature, sighash
+        if s:
+            num_of_signatures += 1
+            total_length += 1 + len(s) + 1  # length, signature, sighash
     total_length += 1 + redeem_script_length  # length, script
 
+    # witness program + signatures + redeem script
+    num_of_witness_items = 1 + num_of_signatures + 1
+
     w = empty_bytearray(total_length)
 
     write_bitcoin_varint(w, num_of_witness_items)
@@ -290,11 +357,12 @@ def witness_p2wsh(
     write_bitcoin_varint(w, 0)
 
     for s in signatures:
-        append_signature(w, s, sighash)  # size of the witness included
+        if s:
+            append_signature(w, s, sighash)  # size of the witness included
 
     # redeem script
     write_bitcoin_varint(w, redeem_script_length)
-    write_output_script_multisig(w, pubkeys, multisig.m)
+    write_bytes_unchecked(w, redeem_script)
 
     return w
 
@@ -317,9 +385,9 @@ def input_script_multisig(
         raise wire.DataError("Invalid multisig parameters")
     signatures[signature_index] = signature  # our signature
 
-    # length of the redeem script
-    pubkeys = multisig_get_pubkeys(multisig)
-    redeem_script_length = output_script_multisig_length(pubkeys, multisig.m)
+    # the serialized redeem script
+    _, redeem_script, _ = _multisig_get_cached(multisig)
+    redeem_script_length = len(redeem_script)
 
     # length of the result
     total_length = 0
@@ -343,7 +411,7 @@ def input_script_multisig(
 
     # redeem script
     write_op_push(w, redeem_script_length)
-    write_output_script_multisig(w, pubkeys, multisig.m)
+    write_bytes_unchecked(w, redeem_script)
 
     return w
 
@@ -362,15 +430,27 @@ def write_output_script_multisig(w: Writer, pubkeys: List[bytes], m: int) -> Non
         if len(pubkey) != 33:
             raise wire.DataError("Invalid multisig parameters")
 
-    w.append(0x50 + m)  # numbers 1 to 16 are pushed as 0x50 + value
+    parts = [bytes((0x50 + m,))]  # numbers 1 to 16 are pushed as 0x50 + value
     for p in pubkeys:
-        append_pubkey(w, p)
-    w.append(0x50 + n)
-    w.append(0xAE)  # OP_CHECKMULTISIG
+        parts.append(b"\x21")  # pushing 33 bytes, all keys are validated above
+        parts.append(p)
+    parts.append(bytes((0x50 + n, 0xAE)))  # OP_n, OP_CHECKMULTISIG
+    # b"".join runs in C, replacing the per-pubkey append calls with a
+    # single copy into the writer
+    w.extend(b"".join(parts))
+
+
+# serialized length of an m-of-n multisig script indexed by n: OP_m,
+# n pubkeys with their push opcodes (keys are always 33 bytes, see
+# write_output_script_multisig), OP_n, OP_CHECKMULTISIG
+_MULTISIG_SCRIPT_LENGTH = tuple(1 + n * (1 + 33) + 1 + 1 for n in range(16))
 
 
 def output_script_multisig_length(pubkeys: List[bytes], m: int) -> int:
-    return 1 + len(pubkeys) * (1 + 33) + 1 + 1  # see output_script_multisig
+    try:
+        return _MULTISIG_SCRIPT_LENGTH[len(pubkeys)]
+    except IndexError:
+        raise wire.DataError("Invalid multisig parameters")
 
 
 # OP_RETURN
@@ -390,11 +470,18 @@ def output_script_paytoopreturn(data: bytes) -> bytearray:
 
 
 def append_signature(w: Writer, signature: bytes, sighash: int) -> None:
-    write_op_push(w, len(signature) + 1)
-    write_bytes_unchecked(w, signature)
+    length = len(signature) + 1
+    if length < 0x4C:
+        # a DER signature is at most 72 bytes, so the push always fits
+        # a single opcode whose value is the length itself
+        w.append(length)
+    else:
+        write_op_push(w, length)
+    w.extend(signature)
     w.append(sighash)
 
 
 def append_pubkey(w: Writer, pubkey: bytes) -> None:
-    write_op_push(w, len(pubkey))
-    write_bytes_unchecked(w, pubkey)
+    # a public key is 33 or 65 bytes, so the push is a single opcode
+    w.append(len(pubkey))
+    w.extend(pubkey)
@@ -25,16 +25,19 @@ if False:
     from trezor.messages.TxInputType import EnumTypeInputScriptType
     from trezor.messages.TxOutputType import EnumTypeOutputScriptType
 
-MULTISIG_INPUT_SCRIPT_TYPES = (
+# script type collections are sets: they are only ever used for
+# membership tests, which cost one hash probe instead of a linear scan
+# (frozenset is not enabled in our MicroPython build)
+MULTISIG_INPUT_SCRIPT_TYPES = {
     InputScriptType.SPENDMULTISIG,
     InputScriptType.SPENDP2SHWITNESS,
     InputScriptType.SPENDWITNESS,
-)
-MULTISIG_OUTPUT_SCRIPT_TYPES = (
+}
+MULTISIG_OUTPUT_SCRIPT_TYPES = {
     OutputScriptType.PAYTOMULTISIG,
     OutputScriptType.PAYTOP2SHWITNESS,
     OutputScriptType.PAYTOWITNESS,
-)
+}
 
 CHANGE_OUTPUT_TO_INPUT_SCRIPT_TYPES = {
     OutputScriptType.PAYTOADDRESS: InputScriptType.SPENDADDRESS,
@@ -42,18 +45,18 @@ CHANGE_OUTPUT_TO_INPUT_SCRIPT_TYPES = {
     OutputScriptType.PAYTOP2SHWITNESS: InputScriptType.SPENDP2SHWITNESS,
     OutputScriptType.PAYTOWITNESS: InputScriptType.SPENDWITNESS,
 }  # type: Dict[EnumTypeOutputScriptType, EnumTypeInputScriptType]
-INTERNAL_INPUT_SCRIPT_TYPES = tuple(CHANGE_OUTPUT_TO_INPUT_SCRIPT_TYPES.values())
-CHANGE_OUTPUT_SCRIPT_TYPES = tuple(CHANGE_OUTPUT_TO_INPUT_SCRIPT_TYPES.keys())
+INTERNAL_INPUT_SCRIPT_TYPES = set(CHANGE_OUTPUT_TO_INPUT_SCRIPT_TYPES.values())
+CHANGE_OUTPUT_SCRIPT_TYPES = set(CHANGE_OUTPUT_TO_INPUT_SCRIPT_TYPES.keys())
 
-SEGWIT_INPUT_SCRIPT_TYPES = (
+SEGWIT_INPUT_SCRIPT_TYPES = {
     InputScriptType.SPENDP2SHWITNESS,
     InputScriptType.SPENDWITNESS,
-)
+}
 
-NONSEGWIT_INPUT_SCRIPT_TYPES = (
+NONSEGWIT_INPUT_SCRIPT_TYPES = {
     InputScriptType.SPENDADDRESS,
     InputScriptType.SPENDMULTISIG,
-)
+}
 
 # Machine instructions
 # ===
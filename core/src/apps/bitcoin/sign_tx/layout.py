@@ -17,7 +17,8 @@ _LOCKTIME_TIMESTAMP_MIN_VALUE = const(500000000)
 
 
 def format_coin_amount(amount: int, coin: coininfo.CoinInfo) -> str:
-    return "%s %s" % (format_amount(amount, coin.decimals), coin.coin_shortcut)
+    # plain concatenation is cheaper than %-formatting under MicroPython
+    return format_amount(amount, coin.decimals) + " " + coin.coin_shortcut
 
 
 def split_address(address: str) -> Iterator[str]:
@@ -64,11 +65,16 @@ async def confirm_total(
     from trezor.ui.text import Text
     from apps.common.confirm import require_hold_to_confirm
 
+    # format the amounts up front so that the allocations happen before
+    # the widget starts laying out and rendering
+    total_amount = format_coin_amount(spending, coin)
+    fee_amount = format_coin_amount(fee, coin)
+
     text = Text("Confirm transaction", ui.ICON_SEND, ui.GREEN)
     text.normal("Total amount:")
-    text.bold(format_coin_amount(spending, coin))
+    text.bold(total_amount)
     text.normal("including fee:")
-    text.bold(format_coin_amount(fee, coin))
+    text.bold(fee_amount)
     await require_hold_to_confirm(ctx, text, ButtonRequestType.SignTx)
 
 
@@ -1,13 +1,25 @@
+from micropython import const
+
 from trezor import ui, utils
 
+from .. import scripts
+
+# do not redraw the loader on progress changes below 1%, it cannot
+# show finer steps anyway and every redraw pushes pixels to the display
+_REPORT_THRESHOLD = const(10)
+
 _progress = 0
 _steps = 0
+_last_reported = 0
 
 
 def init(inputs: int, outputs: int) -> None:
-    global _progress, _steps
+    global _progress, _steps, _last_reported
     _progress = 0
     _steps = inputs + inputs + outputs + inputs
+    _last_reported = -_REPORT_THRESHOLD
+    # a new transaction is starting, drop entries cached for the previous one
+    scripts.clear_caches()
     report_init()
     report()
 
@@ -24,7 +36,11 @@ def report_init() -> None:
 
 
 def report() -> None:
+    global _last_reported
     if utils.DISABLE_ANIMATION:
         return
     p = 1000 * _progress // _steps
+    if p - _last_reported < _REPORT_THRESHOLD:
+        return
+    _last_reported = p
     ui.display.loader(p, False, 18, ui.WHITE, ui.BG)
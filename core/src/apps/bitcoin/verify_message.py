@@ -30,10 +30,12 @@ async def verify_message(ctx, msg):
         script_type = SPENDADDRESS  # p2pkh
     elif recid >= 35 and recid <= 38:
         script_type = SPENDP2SHWITNESS  # segwit-in-p2sh
-        signature = bytes([signature[0] - 4]) + signature[1:]
+        signature = bytearray(signature)
+        signature[0] -= 4
     elif recid >= 39 and recid <= 42:
         script_type = SPENDWITNESS  # native segwit
-        signature = bytes([signature[0] - 8]) + signature[1:]
+        signature = bytearray(signature)
+        signature[0] -= 8
     else:
         raise wire.ProcessError("Invalid signature")
 
@@ -63,20 +63,16 @@ def write_tx_output(
 def write_op_push(w: Writer, n: int) -> None:
     ensure(n >= 0 and n <= 0xFFFFFFFF)
     if n < 0x4C:
-        w.append(n & 0xFF)
+        w.append(n)
     elif n < 0xFF:
         w.append(0x4C)
-        w.append(n & 0xFF)
+        w.append(n)
     elif n < 0xFFFF:
         w.append(0x4D)
-        w.append(n & 0xFF)
-        w.append((n >> 8) & 0xFF)
+        w.extend(n.to_bytes(2, "little"))  # int.to_bytes runs in C
     else:
         w.append(0x4E)
-        w.append(n & 0xFF)
-        w.append((n >> 8) & 0xFF)
-        w.append((n >> 16) & 0xFF)
-        w.append((n >> 24) & 0xFF)
+        w.extend(n.to_bytes(4, "little"))
 
 
 def get_tx_hash(w: HashWriter, double: bool = False, reverse: bool = False) -> bytes:
@@ -98,14 +98,10 @@ def write_bytes_reversed(w: Writer, b: bytes, length: int) -> int:
 def write_bitcoin_varint(w: Writer, n: int) -> None:
     ensure(n >= 0 and n <= 0xFFFFFFFF)
     if n < 253:
-        w.append(n & 0xFF)
+        w.append(n)
     elif n < 0x10000:
         w.append(253)
-        w.append(n & 0xFF)
-        w.append((n >> 8) & 0xFF)
+        w.extend(n.to_bytes(2, "little"))  # int.to_bytes runs in C
     else:
         w.append(254)
-        w.append(n & 0xFF)
-        w.append((n >> 8) & 0xFF)
-        w.append((n >> 16) & 0xFF)
-        w.append((n >> 24) & 0xFF)
+        w.extend(n.to_bytes(4, "little"))
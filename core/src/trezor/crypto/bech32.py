@@ -63,7 +63,11 @@ def bech32_encode(hrp: str, data: List[int]) -> str:
 
 def bech32_decode(bech: str) -> Tuple[Optional[str], Optional[List[int]]]:
     """Validate a Bech32 string, and determine HRP and data."""
-    if (any(ord(x) < 33 or ord(x) > 126 for x in bech)) or (
+    # min()/max() over the encoded bytes run in C, unlike a generator
+    # calling ord() per character (non-ASCII characters encode to bytes
+    # above 126, so they are rejected as well)
+    raw = bech.encode()
+    if (not raw or min(raw) < 33 or max(raw) > 126) or (
         bech.lower() != bech and bech.upper() != bech
     ):
         return (None, None)
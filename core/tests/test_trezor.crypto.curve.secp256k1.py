@@ -141,6 +141,26 @@ class TestCryptoSecp256k1(Secp256k1Common, unittest.TestCase):
     def __init__(self):
         self.impl = secp256k1
 
+    def test_sign_der(self):
+        from trezor.crypto import der
+
+        # sign() and sign_der() use the same deterministic nonce, so the DER
+        # output must encode exactly the r and s of the compact signature
+        seen_msb_set = seen_leading_zero = False
+        while not (seen_msb_set and seen_leading_zero):
+            sk = secp256k1.generate_secret()
+            pk = secp256k1.publickey(sk)
+            dig = random.bytes(32)
+            sig = secp256k1.sign(sk, dig)
+            self.assertTrue(secp256k1.verify(pk, sig, dig))
+            r, s = sig[1:33], sig[33:65]
+            self.assertEqual(secp256k1.sign_der(sk, dig), der.encode_seq((r, s)))
+            # keep going until both variable-length DER branches were hit:
+            # an integer padded with 0x00 because its MSB is set and one
+            # shortened by stripping a leading zero byte
+            seen_msb_set = seen_msb_set or r[0] >= 0x80 or s[0] >= 0x80
+            seen_leading_zero = seen_leading_zero or r[0] == 0 or s[0] == 0
+
 @unittest.skipUnless(not utils.BITCOIN_ONLY, "altcoin")
 class TestCryptoSecp256k1Zkp(Secp256k1Common, unittest.TestCase):
     def __init__(self):